@@ -9,45 +9,352 @@ import imaplib
 import email
 import time
 import json
+import os
+import sys
 import logging
+import logging.handlers
+import queue
+import atexit
+import signal
 import threading
 import subprocess
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+try:
+    from twilio.rest import Client as TwilioClient
+except ImportError:
+    TwilioClient = None
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    from jeepney import DBusAddress, MessageType, new_method_call
+    from jeepney.io.blocking import open_dbus_connection
+except ImportError:
+    open_dbus_connection = None
+try:
+    import simpleaudio
+except ImportError:
+    simpleaudio = None
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from email.header import decode_header
+from email.parser import BytesHeaderParser
 from typing import List, Dict, Optional
 import re
+import random
+import socket
+import ssl
+import functools
 
-# Configuration du logging
+# Configuration du logging : les écritures disque/console sont faites par un thread
+# dédié (QueueListener) pour ne pas bloquer la boucle IMAP
+_log_queue = queue.Queue(-1)
+_log_listener = logging.handlers.QueueListener(
+    _log_queue,
+    logging.FileHandler('mail_monitor.log'),
+    logging.StreamHandler()
+)
+# Niveau réglable sans modifier le code, ex: LOG_LEVEL=WARNING en production
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('mail_monitor.log'),
-        logging.StreamHandler()
-    ]
+    handlers=[logging.handlers.QueueHandler(_log_queue)]
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+def json_loads(data: bytes):
+    """Décode du JSON avec orjson s'il est installé, sinon avec le module standard"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def json_dumps(obj) -> bytes:
+    """Encode en JSON (bytes UTF-8 prêts pour le corps d'une requête HTTP)"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode('utf-8')
+
+# Son joué quand aucun fichier n'est configuré
+DEFAULT_SOUND_FILE = '/usr/share/sounds/alsa/Front_Left.wav'
+
+# RFC 2177 : le serveur peut couper une session IDLE après 29 minutes,
+# on relance donc IDLE un peu avant
+IDLE_TIMEOUT = 28 * 60
+_IDLE_NEW_MAIL_RE = re.compile(rb'^\* \d+ (?:EXISTS|RECENT)\b', re.IGNORECASE)
+
+# Intervalle maximal de vérification en mode polling (serveur sans IDLE)
+MAX_POLL_INTERVAL = 600
+
+# Erreurs signalant une connexion IMAP coupée ou impossible (SSLError, ConnectionError
+# et TimeoutError sont des OSError). L'expression régulière rattrape les exceptions
+# qui enveloppent une erreur réseau sans en hériter.
+_CONN_ERRORS = (imaplib.IMAP4.abort, ConnectionError, TimeoutError, ssl.SSLError, OSError)
+_CONN_RE = re.compile(r'eof|protocol|connection|timeout|socket', re.IGNORECASE)
+# RFC 5530 : codes de réponse d'un LOGIN refusé pour de mauvais identifiants. Les autres
+# codes ([UNAVAILABLE], [INUSE], [LIMIT]...) signalent un refus passager, soumis au backoff
+_LOGIN_REJECTED_RE = re.compile(r'\[(?:AUTHENTICATIONFAILED|AUTHORIZATIONFAILED|EXPIRED)\]', re.IGNORECASE)
+_RESPONSE_CODE_RE = re.compile(r'\[[A-Z][A-Z0-9-]*', re.IGNORECASE)
+# Refus de LOGIN consécutifs sans code de réponse tolérés avant de conclure à de mauvais identifiants
+MAX_PLAIN_LOGIN_REFUSALS = 5
+
+# Code de sortie quand le serveur refuse les identifiants (EX_CONFIG de sysexits.h) :
+# le service systemd ne doit pas être relancé (RestartPreventExitStatus)
+EXIT_LOGIN_REJECTED = 78
+
+def is_connection_error(error: Exception) -> bool:
+    """Indique si l'exception correspond à une perte de connexion avec le serveur IMAP"""
+    return isinstance(error, _CONN_ERRORS) or _CONN_RE.search(str(error)) is not None
+
+def backoff_delay(attempt: int, base: float = 2, cap: float = 300) -> float:
+    """Délai avant la prochaine reconnexion : exponentiel, plafonné et avec une gigue
+    pour éviter que plusieurs instances ne retentent toutes au même instant"""
+    return min(cap, base * 2 ** attempt) * random.uniform(0.5, 1.5)
+
+# Seuls les en-têtes utiles au filtrage et le début du corps sont téléchargés :
+# les pièces jointes ne servent pas au filtrage. PEEK laisse les messages non lus.
+BODY_PREVIEW_BYTES = 16384
+_HEADER_SECTION = 'BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE MIME-VERSION CONTENT-TYPE CONTENT-TRANSFER-ENCODING)]'
+_TEXT_SECTION = f'BODY.PEEK[TEXT]<0.{BODY_PREVIEW_BYTES}>'
+FETCH_ITEMS = f'({_HEADER_SECTION} {_TEXT_SECTION})'
+FETCH_HEADER_ITEMS = f'({_HEADER_SECTION})'
+FETCH_TEXT_ITEMS = f'({_TEXT_SECTION})'
+_FETCH_START_RE = re.compile(rb'^\d+ \(')
+_FETCH_UID_RE = re.compile(rb'\bUID (\d+)')
+
+def parse_fetch_response(msg_data) -> Dict[bytes, Dict[str, bytes]]:
+    """Regroupe les sections d'une réponse UID FETCH par UID.
+
+    imaplib renvoie une liste à plat de tuples (préfixe, littéral) et de bytes :
+    seul le premier élément d'un message commence par son numéro de séquence, et
+    l'attribut UID peut apparaître avant ou après les littéraux.
+    """
+    messages = {}
+    sections = None
+    for item in msg_data:
+        prefix = item[0] if isinstance(item, tuple) else item
+        if not isinstance(prefix, bytes):
+            continue
+        if _FETCH_START_RE.match(prefix):
+            sections = {}
+        if sections is None:
+            continue
+        uid = _FETCH_UID_RE.search(prefix)
+        if uid:
+            messages[uid.group(1)] = sections
+        if isinstance(item, tuple):
+            if b'HEADER' in prefix:
+                sections['header'] = item[1]
+            elif b'TEXT' in prefix:
+                sections['text'] = item[1]
+    return messages
+
+def build_message_set(ids: List[bytes]) -> str:
+    """Construit un ensemble IMAP compact (ex: 1:4,7,9:10) à partir d'une liste d'identifiants"""
+    numbers = sorted(int(i) for i in ids)
+    ranges = []
+    start = previous = numbers[0]
+    for number in numbers[1:]:
+        if number != previous + 1:
+            ranges.append(f"{start}:{previous}" if start != previous else str(start))
+            start = number
+        previous = number
+    ranges.append(f"{start}:{previous}" if start != previous else str(start))
+    return ','.join(ranges)
+
+def build_raw_email(parts: Dict[str, bytes]) -> bytes:
+    """Recompose un email (en-têtes + début du corps) à partir des sections FETCH"""
+    header = parts.get('header', b'').rstrip(b'\r\n')
+    return header + b'\r\n\r\n' + parts.get('text', b'')
+
+# Taille maximale décodée d'une partie texte : l'aperçu n'en garde que 200 caractères
+MAX_CONTENT_BYTES = 65536
+
+# Nettoyage du HTML sans selectolax, compilé une seule fois
+_STYLE_SCRIPT_RE = re.compile(r'<(style|script)[^>]*>.*?</\1>', re.DOTALL | re.IGNORECASE)
+_HTML_TAG_RE = re.compile(r'<[^>]*>')
+
+@functools.lru_cache(maxsize=1024)
+def decode_mime_header(text: str) -> str:
+    """Décode un en-tête MIME encodé.
+
+    Le résultat ne dépend que du texte brut : il est mis en cache, les mêmes
+    expéditeurs et sujets revenant souvent (listes de diffusion, newsletters).
+    """
+    # Les morceaux sont assemblés en une seule fois plutôt que par concaténations successives
+    decoded_words = []
+    
+    for word, encoding in decode_header(text):
+        if isinstance(word, bytes):
+            if encoding:
+                word = word.decode(encoding)
+            else:
+                word = word.decode('utf-8', errors='ignore')
+        decoded_words.append(word)
+    
+    return ''.join(decoded_words)
+
+# TEST TEMPORAIRE - mot magique pour forcer la détection
+TEST_KEYWORD = "TESTKEYWORDINC"
+
+class KeywordMatcher:
+    """Recherche insensible à la casse de plusieurs mots-clés en une seule passe.
+
+    Une regex unique (alternance) est utilisée par défaut ; pour les longues listes,
+    un automate Aho-Corasick (pyahocorasick, en C) parcourt le texte une seule fois
+    quel que soit le nombre de mots-clés.
+
+    Par défaut un mot-clé est trouvé même collé à d'autres lettres ("urgent" dans
+    "insurgent") ; avec whole_words, il doit former un mot entier.
+    """
+    # Nombre de mots-clés à partir duquel l'automate devient plus rapide que la regex
+    AHOCORASICK_MIN_KEYWORDS = 20
+
+    def __init__(self, keywords: List[str], whole_words: bool = False):
+        # Les mots-clés les plus longs d'abord, pour rapporter la correspondance la plus précise
+        self.keywords = sorted(set(keywords), key=len, reverse=True)
+        self.whole_words = whole_words
+        self._automaton = None
+        self._pattern = None
+        if ahocorasick is not None and len(self.keywords) >= self.AHOCORASICK_MIN_KEYWORDS:
+            self._automaton = ahocorasick.Automaton()
+            for keyword in self.keywords:
+                # La longueur en minuscules peut différer de l'original ('İ'.lower() fait 2 caractères)
+                lowered = keyword.lower()
+                self._automaton.add_word(lowered, (keyword, len(lowered)))
+            self._automaton.make_automaton()
+        else:
+            pattern = '|'.join(re.escape(keyword) for keyword in self.keywords)
+            if whole_words:
+                # Lookarounds plutôt que \b : fonctionne aussi pour les mots-clés
+                # qui commencent ou finissent par de la ponctuation ("[URGENT]")
+                pattern = rf'(?<!\w)(?:{pattern})(?!\w)'
+            self._pattern = re.compile(pattern, re.IGNORECASE)
+
+    def search(self, text: str) -> Optional[str]:
+        """Retourne le premier mot-clé trouvé dans le texte, ou None"""
+        if self._automaton is not None:
+            lowered = text.lower()
+            for end, (keyword, length) in self._automaton.iter(lowered):
+                if not self.whole_words or self._is_whole_word(lowered, end - length + 1, end + 1):
+                    return keyword
+            return None
+        match = self._pattern.search(text)
+        return match.group(0) if match else None
+
+    @staticmethod
+    def _is_whole_word(text: str, start: int, end: int) -> bool:
+        """Indique si text[start:end] n'est pas collé à une lettre, un chiffre ou un _"""
+        before = text[start - 1] if start > 0 else ''
+        after = text[end] if end < len(text) else ''
+        return not (before.isalnum() or before == '_' or after.isalnum() or after == '_')
+
+def compile_keywords(keywords: List[str], whole_words: bool = False) -> Optional[KeywordMatcher]:
+    """Prépare la recherche d'une liste de mots-clés, ou None si la liste est vide"""
+    if not keywords:
+        return None
+    return KeywordMatcher(keywords, whole_words)
+
 class EmailMonitor:
     def __init__(self, config_file: str = 'config.json'):
         """Initialise le moniteur d'emails"""
         self.config = self.load_config(config_file)
         self.last_email_uid = None
+        self.uid_validity = None
+        self.state_file = self.config['monitoring'].get('state_file', 'monitor_state.json')
+        self.load_state()
         self.running = False
         self.imap = None
         self.last_error_notification_time = None
+        # Réveille la boucle de surveillance pendant ses attentes (arrêt immédiat)
+        self._wake = threading.Event()
+        self._reconnect_attempts = 0
+        self.login_rejected = False
+        self._plain_login_refusals = 0
+        # IDLE annoncé mais refusé par le serveur : vérification périodique pour cette session
+        self._idle_refused = False
+        self.prepare_filters()
+        # Pool partagé pour l'envoi des notifications (évite un thread par canal et par email)
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='notif')
+        # Session HTTP partagée : les connexions TLS vers ntfy/CallMeBot/Free sont réutilisées
+        self._http = requests.Session()
+        self._http.mount('https://', HTTPAdapter(
+            pool_connections=8,
+            pool_maxsize=16,
+            # Pas de nouvel essai après une erreur de lecture : la requête a pu être traitée
+            # (appel CallMeBot, SMS Free) et la rejouer doublerait la notification
+            max_retries=Retry(total=2, read=0, backoff_factor=0.2)
+        ))
+        self._twilio_clients = {}
+        self._twilio_lock = threading.Lock()
+        # Connexion D-Bus (notifications desktop) et sons décodés, gardés entre deux emails
+        self._dbus = None
+        self._dbus_lock = threading.Lock()
+        self._waves = {}
         
     def load_config(self, config_file: str) -> Dict:
         """Charge la configuration depuis un fichier JSON"""
         try:
-            with open(config_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            with open(config_file, 'rb') as f:
+                return json_loads(f.read())
         except FileNotFoundError:
             logger.error(f"Fichier de configuration {config_file} non trouvé")
             self.create_default_config(config_file)
             return self.load_config(config_file)
     
+    def load_state(self):
+        """Reprend le dernier UID traité, sauvegardé lors d'une exécution précédente"""
+        try:
+            with open(self.state_file, 'rb') as f:
+                state = json_loads(f.read())
+            self.uid_validity = state['uid_validity'].encode()
+            self.last_email_uid = int(state['last_uid'])
+            logger.info(f"État restauré depuis {self.state_file} (dernier UID traité: {self.last_email_uid})")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            logger.warning(f"Fichier d'état {self.state_file} illisible, ignoré: {e}")
+
+    def save_state(self):
+        """Sauvegarde le dernier UID traité pour ne pas retraiter ni manquer d'emails au redémarrage"""
+        if self.uid_validity is None or self.last_email_uid is None:
+            return
+        state = {'uid_validity': self.uid_validity.decode(), 'last_uid': self.last_email_uid}
+        tmp_file = self.state_file + '.tmp'
+        try:
+            with open(tmp_file, 'wb') as f:
+                f.write(json_dumps(state))
+            # Remplacement atomique : un arrêt brutal ne laisse jamais un fichier tronqué
+            os.replace(tmp_file, self.state_file)
+        except OSError as e:
+            logger.warning(f"Impossible de sauvegarder l'état dans {self.state_file}: {e}")
+
+    def prepare_filters(self):
+        """Prépare la recherche des listes de filtres, une seule fois au démarrage"""
+        filters = self.config['filters']
+        # Option : mots-clés du sujet et du corps en mots entiers (les expéditeurs
+        # restent cherchés comme sous-chaînes, ex: "@entreprise.com")
+        whole_words = filters.get('whole_words', False)
+        self._subject_matcher = compile_keywords(filters.get('subject_keywords', []) + [TEST_KEYWORD], whole_words)
+        # Sans mots-clés de corps, le corps n'est jamais analysé pour le filtrage
+        body_keywords = filters.get('keywords', [])
+        self._body_matcher = compile_keywords(body_keywords + [TEST_KEYWORD], whole_words) if body_keywords else None
+        self._sender_matcher = compile_keywords(filters.get('senders', []))
+    
     def create_default_config(self, config_file: str):
         """Crée un fichier de configuration par défaut"""
         default_config = {
@@ -71,7 +378,8 @@ class EmailMonitor:
                 "subject_keywords": [
                     "URGENT",
                     "ALERTE"
-                ]
+                ],
+                "whole_words": False
             },
             "notifications": {
                 "desktop": {
@@ -137,7 +445,8 @@ class EmailMonitor:
             },
             "monitoring": {
                 "check_interval": 5,
-                "mailbox": "INBOX"
+                "mailbox": "INBOX",
+                "state_file": "monitor_state.json"
             }
         }
         
@@ -148,7 +457,16 @@ class EmailMonitor:
         logger.info("Veuillez modifier ce fichier avec vos paramètres avant de relancer le programme")
     
     def connect_to_imap(self) -> bool:
-        """Se connecte au serveur IMAP Zimbra"""
+        """Se connecte au serveur IMAP Zimbra (ou réutilise la session encore valide)"""
+        if self.imap and self.imap.state == 'SELECTED':
+            # Un NOOP coûte un aller-retour, une reconnexion TLS + LOGIN + SELECT plusieurs
+            try:
+                if self.imap.noop()[0] == 'OK':
+                    return True
+            except (imaplib.IMAP4.error, OSError) as e:
+                logger.info(f"Session IMAP existante inutilisable ({e}), reconnexion")
+            self._drop_connection()
+
         try:
             if self.config['email']['use_ssl']:
                 self.imap = imaplib.IMAP4_SSL(
@@ -166,132 +484,228 @@ class EmailMonitor:
                 self.config['email']['password']
             )
             
-            self.imap.select(self.config['monitoring']['mailbox'])
+            # Lecture seule (EXAMINE) : aucun flag modifié, pas d'EXPUNGE implicite
+            self.imap.select(self.config['monitoring']['mailbox'], readonly=True)
+            self.sync_uid_baseline()
+            self.login_rejected = False
+            self._plain_login_refusals = 0
+            self._idle_refused = False
             logger.info("Connexion IMAP établie avec succès")
             return True
             
         except Exception as e:
             logger.error(f"Erreur de connexion IMAP: {e}")
-            error_message = str(e).lower()
-            
+            # Réponse NO au LOGIN (abort hérite de error mais signale une coupure réseau)
+            login_refused = (
+                self.imap is not None and self.imap.state == 'NONAUTH'
+                and isinstance(e, imaplib.IMAP4.error) and not isinstance(e, imaplib.IMAP4.abort)
+            )
+            if login_refused and _LOGIN_REJECTED_RE.search(str(e)):
+                # Identifiants refusés explicitement : une nouvelle tentative échouerait de la même façon
+                self.login_rejected = True
+            elif login_refused and not _RESPONSE_CODE_RE.search(str(e)):
+                # Serveur sans code de réponse : seule la répétition du refus le rend définitif
+                self._plain_login_refusals += 1
+                self.login_rejected = self._plain_login_refusals >= MAX_PLAIN_LOGIN_REFUSALS
+            else:
+                self._plain_login_refusals = 0
+                self.login_rejected = False
+            self._drop_connection()
             # Notifier pour les erreurs critiques de connexion
-            if any(err in error_message for err in ["eof occurred", "authentication failed", "connection refused"]):
+            if self.login_rejected:
+                title = "🚨 Erreur de Connexion Email"
+                body = f"Identifiants refusés par le serveur IMAP : {e}. Corrigez config.json puis relancez le service."
+                self.send_ntfy_error_notification(title, body)
+            elif is_connection_error(e):
                 title = "🚨 Erreur de Connexion Email"
                 body = f"Impossible de se connecter au serveur IMAP : {e}. Le service va retenter."
                 self.send_ntfy_error_notification(title, body)
                 
             return False
+
+    def reconnect(self) -> bool:
+        """Tente une reconnexion. En cas d'échec, attend un délai croissant (backoff)
+        avant de rendre la main, pour ne pas marteler le serveur pendant une panne."""
+        if self.connect_to_imap():
+            self._reconnect_attempts = 0
+            return True
+        if self.login_rejected:
+            logger.error("Identifiants IMAP refusés, arrêt de la surveillance")
+            self.stop_monitoring()
+            return False
+        delay = backoff_delay(self._reconnect_attempts)
+        self._reconnect_attempts += 1
+        logger.warning(f"Reconnexion échouée, nouvel essai dans {delay:.0f} secondes.")
+        self._wake.wait(delay)
+        return False
+
+    def sync_uid_baseline(self):
+        """Initialise le suivi des emails par UID après la sélection de la boîte.
+
+        Au premier démarrage, ou si le serveur a changé d'UIDVALIDITY, seuls les
+        emails arrivés ensuite sont traités. Après une reconnexion ou un redémarrage
+        (état sauvegardé), on reprend au dernier UID vu pour ne rien manquer pendant
+        la coupure.
+        """
+        _, validity = self.imap.response('UIDVALIDITY')
+        _, uidnext = self.imap.response('UIDNEXT')
+        validity = validity[0] if validity and validity[0] else None
+        if self.last_email_uid is not None and validity == self.uid_validity:
+            return
+
+        self.uid_validity = validity
+        if uidnext and uidnext[0]:
+            self.last_email_uid = int(uidnext[0]) - 1
+        else:
+            status, data = self.imap.uid('SEARCH', None, 'ALL')
+            uids = data[0].split() if status == 'OK' and data[0] else []
+            self.last_email_uid = int(uids[-1]) if uids else 0
+        self.save_state()
+        logger.info(f"Suivi des nouveaux emails à partir de l'UID {self.last_email_uid + 1}")
+
+    def _drop_connection(self):
+        """Ferme brutalement la session IMAP courante (sans LOGOUT) pour forcer une reconnexion"""
+        if self.imap:
+            try:
+                self.imap.shutdown()
+            except OSError:
+                pass
+        self.imap = None
+
+    def _pop_new_mail_responses(self) -> bool:
+        """Consomme les EXISTS/RECENT qu'imaplib a mis de côté pendant une autre
+        commande (SEARCH, FETCH, NOOP). Le serveur ne les renverra pas pendant IDLE."""
+        if not self.imap:
+            return False
+        has_new_mail = False
+        for name in ('EXISTS', 'RECENT'):
+            if self.imap.response(name)[1] != [None]:
+                has_new_mail = True
+        return has_new_mail
+
+    def _imap_call(self, command: str, *args):
+        """Exécute une commande IMAP sur la session persistante.
+
+        Si la connexion est tombée, on se reconnecte une seule fois puis on
+        rejoue la commande ; les autres erreurs remontent à l'appelant.
+        """
+        try:
+            return getattr(self.imap, command)(*args)
+        except (imaplib.IMAP4.abort, OSError) as e:
+            logger.warning(f"Session IMAP interrompue ({e}), reconnexion...")
+            self._drop_connection()
+            if not self.connect_to_imap():
+                raise
+            return getattr(self.imap, command)(*args)
     
     def decode_mime_words(self, text: str) -> str:
         """Décode les mots MIME encodés"""
         if text is None:
             return ""
-        
-        decoded_words = decode_header(text)
-        decoded_text = ""
-        
-        for word, encoding in decoded_words:
-            if isinstance(word, bytes):
-                if encoding:
-                    decoded_text += word.decode(encoding)
-                else:
-                    decoded_text += word.decode('utf-8', errors='ignore')
-            else:
-                decoded_text += word
-        
-        return decoded_text
+        if not isinstance(text, str):
+            # Objet Header (en-tête 8 bits brut) : non hashable, donc converti
+            text = str(text)
+        return decode_mime_header(text)
     
-    def check_email_filters(self, sender: str, subject: str, content: str) -> bool:
-        """Vérifie si l'email correspond aux filtres configurés."""
-        logger.info("=== FILTRAGE EMAIL ===")
-        logger.info(f"Expéditeur: {sender}")
-        logger.info(f"Sujet: {subject}")
-        content_preview = content.strip()
-        logger.info(f"Contenu (100 premiers caractères): {content_preview[:100]}...")
+    def _matches_sender(self, sender: str) -> Optional[str]:
+        """Retourne l'expéditeur autorisé reconnu dans l'en-tête From, ou None"""
+        return self._sender_matcher.search(sender) if self._sender_matcher else None
+
+    def _matches_subject(self, subject: str) -> Optional[str]:
+        """Retourne le mot-clé trouvé dans le sujet, ou None (le mot magique de test est inclus)"""
+        return self._subject_matcher.search(subject)
+
+    def _matches_body(self, content: str) -> Optional[str]:
+        """Retourne le mot-clé trouvé dans le corps, ou None s'il n'y a pas de mot-clé de corps"""
+        return self._body_matcher.search(content) if self._body_matcher else None
+
+    def check_header_filters(self, sender: str, subject: str) -> bool:
+        """Vérifie les filtres portant sur les en-têtes (sujet et expéditeur)."""
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("=== FILTRAGE EMAIL ===")
+            logger.debug(f"Expéditeur: {sender}")
+            logger.debug(f"Sujet: {subject}")
         
-        # TEST TEMPORAIRE - mot magique pour forcer la détection
-        if "TESTKEYWORDINC" in subject.upper() or "TESTKEYWORDINC" in content.upper():
-            logger.info("🧪 Email accepté car mot-clé de test détecté")
+        # Les critères sont indépendants (un seul suffit) : on teste d'abord les
+        # chaînes les plus courtes, le corps de l'email étant vérifié en dernier
+        # 1. Vérification des expéditeurs autorisés
+        if debug:
+            logger.debug(f"Vérification expéditeurs autorisés: {self.config['filters'].get('senders', [])}")
+        if self._matches_sender(sender):
+            logger.info(f"✅ Email accepté car expéditeur autorisé: {sender}")
             return True
-        
-        # 1. PRIORITÉ : Vérification des mots-clés (peu importe l'expéditeur)
-        # Mots-clés dans le sujet
-        subject_keywords = self.config['filters'].get('subject_keywords', [])
-        logger.info(f"Vérification mots-clés sujet: {subject_keywords}")
-        for keyword in subject_keywords:
-            if keyword.lower() in subject.lower():
-                logger.info(f"✅ Email accepté car mot-clé '{keyword}' trouvé dans le sujet")
-                return True
-        
-        # Mots-clés dans le contenu du corps
-        body_keywords = self.config['filters'].get('keywords', [])
-        logger.info(f"Vérification mots-clés corps: {body_keywords}")
-        for keyword in body_keywords:
-            # Recherche insensible à la casse et même si collé à d'autres lettres
-            if keyword.lower() in content.lower():
-                logger.info(f"✅ Email accepté car mot-clé '{keyword}' trouvé dans le contenu")
-                return True
 
-        # 2. Vérification des expéditeurs autorisés
-        allowed_senders = self.config['filters'].get('senders', [])
-        logger.info(f"Vérification expéditeurs autorisés: {allowed_senders}")
-        for allowed_sender in allowed_senders:
-            if allowed_sender.lower() in sender.lower():
-                logger.info(f"✅ Email accepté car expéditeur autorisé: {sender}")
-                return True
+        # 2. Mots-clés dans le sujet
+        if debug:
+            logger.debug(f"Vérification mots-clés sujet: {self.config['filters'].get('subject_keywords', [])}")
+        keyword = self._matches_subject(subject)
+        if keyword:
+            logger.info(f"✅ Email accepté car mot-clé '{keyword}' trouvé dans le sujet")
+            return True
         
-        logger.info("❌ Email rejeté - aucun critère de filtre ne correspond")
+        return False
+
+    def check_body_filters(self, content: str) -> bool:
+        """Vérifie les mots-clés dans le contenu du corps de l'email."""
+        if self._body_matcher is None:
+            return False
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Contenu (100 premiers caractères): {content.strip()[:100]}...")
+            logger.debug(f"Vérification mots-clés corps: {self.config['filters'].get('keywords', [])}")
+        # 3. Recherche insensible à la casse (même collé à d'autres lettres, sauf whole_words)
+        keyword = self._matches_body(content)
+        if keyword:
+            logger.info(f"✅ Email accepté car mot-clé '{keyword}' trouvé dans le contenu")
+            return True
+
         return False
     
     def get_email_content(self, msg) -> str:
-        """Extrait le contenu textuel d'un email, en gérant le multipart et le HTML."""
-        plain_text_content = ""
+        """Extrait le contenu textuel d'un email, en gérant le multipart et le HTML.
+
+        Seule la première partie text/plain est décodée (à défaut, la première
+        partie text/html) : les autres parties ne sont jamais lues.
+        """
         html_content = ""
         
-        if msg.is_multipart():
-            for part in msg.walk():
-                content_type = part.get_content_type()
-                if content_type not in ["text/plain", "text/html"]:
-                    continue
+        # walk() renvoie le message lui-même s'il n'est pas multipart
+        for part in msg.walk():
+            content_type = part.get_content_type()
+            if content_type not in ("text/plain", "text/html") or part.get_content_disposition() == 'attachment':
+                continue
+            if content_type == "text/html" and html_content:
+                continue
 
-                try:
-                    payload = part.get_payload(decode=True)
-                    if not payload:
-                        continue
-                    charset = part.get_content_charset() or 'utf-8'
-                    decoded_payload = payload.decode(charset, errors='ignore')
-
-                    if content_type == "text/plain":
-                        plain_text_content += decoded_payload
-                    elif content_type == "text/html":
-                        html_content += decoded_payload
-                except Exception as e:
-                    logger.warning(f"Impossible de décoder une partie de l'email: {e}")
+            try:
+                payload = part.get_payload(decode=True)
+                if not payload:
                     continue
-        else:
-            content_type = msg.get_content_type()
-            if content_type in ["text/plain", "text/html"]:
-                try:
-                    payload = msg.get_payload(decode=True)
-                    if payload:
-                        charset = msg.get_content_charset() or 'utf-8'
-                        decoded_payload = payload.decode(charset, errors='ignore')
-                        if content_type == "text/plain":
-                            plain_text_content = decoded_payload
-                        elif content_type == "text/html":
-                            html_content = decoded_payload
-                except Exception as e:
-                    logger.warning(f"Impossible de décoder le contenu de l'email: {e}")
+                charset = part.get_content_charset() or 'utf-8'
+                decoded_payload = payload[:MAX_CONTENT_BYTES].decode(charset, errors='ignore')
+            except Exception as e:
+                logger.warning(f"Impossible de décoder une partie de l'email: {e}")
+                continue
 
-        if plain_text_content.strip():
-            return plain_text_content
+            if content_type == "text/plain":
+                if decoded_payload.strip():
+                    return decoded_payload
+            else:
+                html_content = decoded_payload
 
         if html_content:
-            # Suppression des styles et scripts
-            text_from_html = re.sub(r'<style[^>]*>.*?</style>', '', html_content, flags=re.DOTALL | re.IGNORECASE)
-            text_from_html = re.sub(r'<script[^>]*>.*?</script>', '', text_from_html, flags=re.DOTALL | re.IGNORECASE)
-            # Suppression des autres balises HTML
-            text_from_html = re.sub(r'<[^>]*>', '', text_from_html)
+            if LexborHTMLParser is not None:
+                # Parseur HTML en C : une seule passe, sans les cas pathologiques des regex
+                tree = LexborHTMLParser(html_content)
+                tree.strip_tags(['style', 'script'])
+                # Nœuds texte concaténés tels quels, comme la suppression des balises par regex
+                text_from_html = tree.text()
+            else:
+                # Suppression des styles et scripts
+                text_from_html = _STYLE_SCRIPT_RE.sub('', html_content)
+                # Suppression des autres balises HTML
+                text_from_html = _HTML_TAG_RE.sub('', text_from_html)
             # Nettoyage des lignes vides
             text_from_html = '\n'.join([line.strip() for line in text_from_html.splitlines() if line.strip()])
             return text_from_html
@@ -299,36 +713,82 @@ class EmailMonitor:
         return ""
     
     def check_new_emails(self) -> List[Dict]:
-        """Vérifie les nouveaux emails"""
+        """Vérifie les emails arrivés depuis le dernier UID traité"""
         try:
-            # Recherche des emails non lus
-            status, messages = self.imap.search(None, 'UNSEEN')
+            # Les EXISTS reçus jusqu'ici sont couverts par la recherche qui suit
+            self._pop_new_mail_responses()
+            # Recherche incrémentale : seuls les UID supérieurs au dernier vu
+            status, messages = self._imap_call('uid', 'SEARCH', None, f'UID {self.last_email_uid + 1}:*')
             
             if status != 'OK':
                 logger.error("Erreur lors de la recherche d'emails")
                 return []
             
-            email_ids = messages[0].split()
+            # "n:*" renvoie toujours le dernier message, même s'il est plus ancien que n
+            email_ids = [uid for uid in messages[0].split() if int(uid) > self.last_email_uid]
             new_matching_emails = []
+            if not email_ids:
+                return new_matching_emails
+            
+            # Un seul FETCH pour tous les messages au lieu d'un aller-retour par email.
+            # Sans mot-clé de corps, les en-têtes suffisent au filtrage : le début du
+            # corps n'est téléchargé ensuite que pour les emails retenus (aperçu)
+            headers_only = self._body_matcher is None
+            status, msg_data = self._imap_call(
+                'uid', 'FETCH', build_message_set(email_ids),
+                FETCH_HEADER_ITEMS if headers_only else FETCH_ITEMS
+            )
             
+            if status != 'OK':
+                logger.error("Erreur lors de la récupération des emails")
+                return new_matching_emails
+            
+            fetched = parse_fetch_response(msg_data)
+            
+            # Première passe : filtrage sur les en-têtes
+            candidates = []
             for email_id in email_ids:
                 try:
-                    status, msg_data = self.imap.fetch(email_id, '(RFC822)')
-                    
-                    if status != 'OK':
+                    parts = fetched.get(email_id)
+                    if not parts:
                         continue
+                    # Extraction des informations : seuls les en-têtes sont analysés ici
+                    headers = BytesHeaderParser().parsebytes(parts.get('header', b''))
+                    sender = self.decode_mime_words(headers.get('From', ''))
+                    subject = self.decode_mime_words(headers.get('Subject', ''))
+                    date = headers.get('Date', '')
+                    accepted = self.check_header_filters(sender, subject)
                     
-                    raw_email = msg_data[0][1]
-                    msg = email.message_from_bytes(raw_email)
-                    
-                    # Extraction des informations
-                    sender = self.decode_mime_words(msg.get('From', ''))
-                    subject = self.decode_mime_words(msg.get('Subject', ''))
-                    date = msg.get('Date', '')
+                    if not accepted and headers_only:
+                        logger.info(f"❌ Email rejeté - aucun critère de filtre ne correspond: {subject}")
+                    else:
+                        candidates.append((email_id, parts, sender, subject, date, accepted))
+                
+                except Exception as e:
+                    logger.error(f"Erreur lors du traitement de l'email {email_id}: {e}")
+            
+            if headers_only and candidates:
+                status, msg_data = self._imap_call(
+                    'uid', 'FETCH', build_message_set([c[0] for c in candidates]), FETCH_TEXT_ITEMS
+                )
+                if status != 'OK':
+                    # Lot non marqué comme traité : il sera repris à la prochaine vérification
+                    logger.error("Erreur lors de la récupération du contenu des emails")
+                    return new_matching_emails
+                for email_id, text_parts in parse_fetch_response(msg_data).items():
+                    if email_id in fetched:
+                        fetched[email_id].update(text_parts)
+            
+            # Seconde passe : analyse du corps MIME (filtre par mots-clés et aperçu)
+            for email_id, parts, sender, subject, date, accepted in candidates:
+                try:
+                    msg = email.message_from_bytes(build_raw_email(parts))
                     content = self.get_email_content(msg)
+                    accepted = accepted or self.check_body_filters(content)
                     
-                    # Vérification des filtres
-                    if self.check_email_filters(sender, subject, content):
+                    if not accepted:
+                        logger.info(f"❌ Email rejeté - aucun critère de filtre ne correspond: {subject}")
+                    else:
                         email_info = {
                             'id': email_id.decode(),
                             'sender': sender,
@@ -342,32 +802,156 @@ class EmailMonitor:
                 except Exception as e:
                     logger.error(f"Erreur lors du traitement de l'email {email_id}: {e}")
             
+            # Les UID ne sont marqués comme traités qu'une fois les deux FETCH réussis :
+            # en cas d'erreur, tout le lot sera repris à la prochaine vérification
+            self.last_email_uid = max(int(uid) for uid in email_ids)
             return new_matching_emails
             
         except Exception as e:
             logger.error(f"Erreur lors de la vérification des emails: {e}")
             
-            error_message = str(e).lower()
-            if "eof occurred in violation of protocol" in error_message:
+            if is_connection_error(e):
                 title = "🚨 Erreur Critique Email Monitor"
                 body = "La connexion IMAP a été coupée (possible blocage IP). Le service va tenter de se reconnecter. Pensez à augmenter l'intervalle de vérification si l'erreur persiste."
                 self.send_ntfy_error_notification(title, body)
                 # Forcer une reconnexion à la prochaine itération
-                if self.imap:
-                    try:
-                        self.imap.logout()
-                    except:
-                        pass # Ignore errors on logout
-                self.imap = None
+                self._drop_connection()
 
             return []
-    
+
+    def supports_idle(self) -> bool:
+        """Indique si le serveur IMAP annonce l'extension IDLE (RFC 2177) et ne l'a pas refusée"""
+        return bool(self.imap) and not self._idle_refused and 'IDLE' in self.imap.capabilities
+
+    def wait_for_new_emails(self, timeout: int = IDLE_TIMEOUT) -> bool:
+        """Attend en mode IDLE que le serveur signale un nouvel email.
+
+        Retourne True si le serveur a poussé un EXISTS/RECENT, False si le délai
+        est écoulé sans activité ou si la connexion a été perdue.
+        """
+        # Un EXISTS arrivé pendant la dernière commande ne serait pas répété en IDLE
+        if self._pop_new_mail_responses():
+            return True
+        tag = self.imap._new_tag()
+        try:
+            self.imap.send(tag + b' IDLE\r\n')
+            # Des réponses non taggées (ex: EXISTS d'un mail arrivé à l'instant) peuvent
+            # précéder la continuation "+" : elles sont lues et prises en compte
+            has_new_mail = False
+            while True:
+                response = self.imap.readline()
+                if not response:
+                    raise imaplib.IMAP4.abort("connexion fermée pendant IDLE")
+                if response.startswith(b'+'):
+                    break
+                if response.startswith(tag):
+                    # Sans ce repli, la boucle renverrait IDLE + NOOP sans aucun délai
+                    logger.warning(f"Commande IDLE refusée par le serveur ({response!r}), passage en vérification périodique")
+                    self._idle_refused = True
+                    return has_new_mail
+                if _IDLE_NEW_MAIL_RE.match(response):
+                    has_new_mail = True
+
+            interrupted = False
+            self.imap.sock.settimeout(timeout)
+            try:
+                # Nouveau mail déjà signalé : inutile d'attendre, on sort tout de suite d'IDLE
+                while not has_new_mail:
+                    line = self.imap.readline()
+                    if not line:
+                        raise imaplib.IMAP4.abort("connexion fermée pendant IDLE")
+                    if _IDLE_NEW_MAIL_RE.match(line):
+                        has_new_mail = True
+            except (socket.timeout, KeyboardInterrupt) as e:
+                # Arrêt demandé pendant l'attente : on sort d'abord du mode IDLE pour
+                # que le LOGOUT de stop_monitoring() soit accepté par le serveur
+                interrupted = isinstance(e, KeyboardInterrupt)
+                # Le tampon de lecture est inutilisable après une lecture interrompue, on le recrée
+                self.imap.file.close()
+                self.imap.file = self.imap.sock.makefile('rb')
+            finally:
+                self.imap.sock.settimeout(None)
+
+            # Sortie du mode IDLE : on consomme les réponses jusqu'à la réponse taggée
+            self.imap.send(b'DONE\r\n')
+            while True:
+                line = self.imap.readline()
+                if not line:
+                    raise imaplib.IMAP4.abort("connexion fermée pendant IDLE")
+                if line.startswith(tag):
+                    break
+
+            if interrupted:
+                raise KeyboardInterrupt
+            return has_new_mail
+
+        except (imaplib.IMAP4.error, OSError) as e:
+            logger.error(f"Erreur pendant l'attente IDLE: {e}")
+            self._drop_connection()
+            return False
+
+        finally:
+            # imaplib garde une entrée par tag envoyé : la réponse taggée a été lue ici
+            if self.imap:
+                self.imap.tagged_commands.pop(tag, None)
+
+    def notify_dbus(self, title: str, message: str, timeout_ms: int) -> bool:
+        """Affiche une notification critique via D-Bus (org.freedesktop.Notifications),
+        sans lancer de processus notify-send.
+
+        Retourne False si jeepney n'est pas installé ou si aucun bus de session
+        n'est joignable : l'appelant se rabat alors sur notify-send.
+        """
+        if open_dbus_connection is None:
+            return False
+        with self._dbus_lock:
+            try:
+                if self._dbus is None:
+                    self._dbus = open_dbus_connection(bus='SESSION')
+                address = DBusAddress(
+                    '/org/freedesktop/Notifications',
+                    bus_name='org.freedesktop.Notifications',
+                    interface='org.freedesktop.Notifications'
+                )
+                # Notify(app_name, replaces_id, icon, summary, body, actions, hints, timeout)
+                reply = self._dbus.send_and_get_reply(new_method_call(
+                    address, 'Notify', 'susssasa{sv}i',
+                    ('Email Monitor', 0, '', title, message, [], {'urgency': ('y', 2)}, timeout_ms)
+                ), timeout=5)
+                # jeepney renvoie les erreurs D-Bus (ex: ServiceUnknown, aucun démon de
+                # notifications) comme une réponse ordinaire, sans lever d'exception
+                if reply.header.message_type == MessageType.error:
+                    logger.debug(f"Notification D-Bus refusée, repli sur notify-send: {reply.body}")
+                    return False
+                return True
+            except Exception as e:
+                logger.debug(f"Notification D-Bus impossible, repli sur notify-send: {e}")
+                if self._dbus is not None:
+                    self._dbus.close()
+                    self._dbus = None
+                return False
+
+    def load_wave(self, sound_file: str):
+        """Retourne le son décodé par simpleaudio (mis en cache), ou None pour se
+        rabattre sur aplay/pactl"""
+        if simpleaudio is None:
+            return None
+        wave = self._waves.get(sound_file)
+        if wave is None:
+            try:
+                wave = self._waves[sound_file] = simpleaudio.WaveObject.from_wave_file(sound_file)
+            except Exception as e:
+                logger.debug(f"Lecture de {sound_file} avec simpleaudio impossible: {e}")
+        return wave
+
     def send_desktop_notification(self, email_info: Dict):
         """Envoie une notification desktop"""
         try:
             title = f"Nouveau mail: {email_info['subject'][:50]}"
             message = f"De: {email_info['sender']}\n{email_info['content_preview']}"
             
+            if self.notify_dbus(title, message, 10000):
+                return
             subprocess.run([
                 'notify-send',
                 '-u', 'critical',
@@ -383,39 +967,51 @@ class EmailMonitor:
         """Joue un son d'alerte"""
         try:
             sound_file = self.config['notifications']['sound'].get('sound_file')
-            if sound_file:
+            wave = self.load_wave(sound_file or DEFAULT_SOUND_FILE)
+            if wave is not None:
+                wave.play().wait_done()
+            elif sound_file:
                 subprocess.run(['aplay', sound_file], check=False, capture_output=True)
             else:
                 # Son système par défaut
-                subprocess.run(['pactl', 'upload-sample', '/usr/share/sounds/alsa/Front_Left.wav', 'bell'], check=False)
+                subprocess.run(['pactl', 'upload-sample', DEFAULT_SOUND_FILE, 'bell'], check=False)
                 subprocess.run(['pactl', 'play-sample', 'bell'], check=False)
                 
         except Exception as e:
             logger.error(f"Erreur son d'alerte: {e}")
     
-    def send_ntfy_notification(self, email_info: Dict):
-        """Envoie une notification via ntfy.sh"""
+    def send_ntfy_notification(self, email_infos: List[Dict]):
+        """Envoie une notification via ntfy.sh (une seule pour tout le lot d'emails)"""
         try:
             ntfy_config = self.config['notifications']['ntfy']
             
-            # Extraire le nom de l'expéditeur (sans l'email complet)
-            sender_name = email_info['sender'].split('<')[0].strip()
-            if not sender_name:
-                sender_name = email_info['sender'].split('@')[0]
+            def sender_name(email_info: Dict) -> str:
+                # Extraire le nom de l'expéditeur (sans l'email complet)
+                name = email_info['sender'].split('<')[0].strip()
+                return name or email_info['sender'].split('@')[0]
             
-            # Titre plus compact et joli
-            title = f"✉️ {email_info['subject'][:40]}{'...' if len(email_info['subject']) > 40 else ''}"
-            
-            # Message structuré et lisible
-            message = f"👤 **{sender_name}**\n\n"
-            
-            # Ajouter aperçu du contenu seulement s'il est informatif
-            content_preview = email_info['content_preview'].strip()
-            if content_preview and len(content_preview) > 10:
-                # Nettoyer le contenu
-                clean_content = content_preview.replace('\n', ' ').replace('\r', ' ')
-                clean_content = ' '.join(clean_content.split())  # Supprimer espaces multiples
-                message += f"💬 {clean_content[:100]}{'...' if len(clean_content) > 100 else ''}"
+            if len(email_infos) == 1:
+                email_info = email_infos[0]
+                # Titre plus compact et joli
+                title = f"✉️ {email_info['subject'][:40]}{'...' if len(email_info['subject']) > 40 else ''}"
+                
+                # Message structuré et lisible
+                message = f"👤 **{sender_name(email_info)}**\n\n"
+                
+                # Ajouter aperçu du contenu seulement s'il est informatif
+                content_preview = email_info['content_preview'].strip()
+                if content_preview and len(content_preview) > 10:
+                    # Nettoyer le contenu
+                    clean_content = content_preview.replace('\n', ' ').replace('\r', ' ')
+                    clean_content = ' '.join(clean_content.split())  # Supprimer espaces multiples
+                    message += f"💬 {clean_content[:100]}{'...' if len(clean_content) > 100 else ''}"
+            else:
+                # Plusieurs emails arrivés ensemble : un résumé, une ligne par email
+                title = f"✉️ {len(email_infos)} nouveaux mails urgents"
+                message = '\n'.join(
+                    f"• **{sender_name(email_info)}** : {email_info['subject'][:60]}"
+                    for email_info in email_infos
+                )
             
             data = {
                 'title': title,
@@ -425,7 +1021,7 @@ class EmailMonitor:
                 'click': 'https://partage.insa-lyon.fr'  # Lien vers votre webmail
             }
             
-            response = requests.post(ntfy_config['url'], json=data, timeout=10)
+            response = self._http.post(ntfy_config['url'], data=json_dumps(data), headers=JSON_HEADERS, timeout=10)
             
             if response.status_code == 200:
                 logger.info("Notification ntfy envoyée avec succès")
@@ -435,39 +1031,61 @@ class EmailMonitor:
         except Exception as e:
             logger.error(f"Erreur notification ntfy: {e}")
     
-    def send_webhook_notification(self, email_info: Dict):
-        """Envoie une notification via webhook"""
+    def send_webhook_notification(self, email_infos: List[Dict]):
+        """Envoie une notification via webhook.
+
+        En POST, un seul appel par lot : le format 'new_email' est conservé pour un
+        email isolé, 'new_emails' porte la liste quand plusieurs arrivent ensemble.
+        En GET, les paramètres d'URL ne portent qu'un email : un appel par email.
+        """
         try:
             webhook_config = self.config['notifications']['webhook']
-            
-            payload = {
-                'type': 'new_email',
-                'timestamp': datetime.now().isoformat(),
-                'email': email_info
-            }
-            
             method = webhook_config.get('method', 'POST').upper()
+            timestamp = datetime.now().isoformat()
             
             if method == 'POST':
-                response = requests.post(webhook_config['url'], json=payload, timeout=10)
+                if len(email_infos) == 1:
+                    payload = {'type': 'new_email', 'timestamp': timestamp, 'email': email_infos[0]}
+                else:
+                    payload = {'type': 'new_emails', 'timestamp': timestamp, 'emails': email_infos}
+                responses = [self._http.post(webhook_config['url'], data=json_dumps(payload), headers=JSON_HEADERS, timeout=10)]
             elif method == 'GET':
-                response = requests.get(webhook_config['url'], params=payload, timeout=10)
+                responses = [
+                    self._http.get(webhook_config['url'], params={'type': 'new_email', 'timestamp': timestamp, 'email': email_info}, timeout=10)
+                    for email_info in email_infos
+                ]
             
-            if response.status_code < 300:
-                logger.info("Notification webhook envoyée avec succès")
-            else:
-                logger.error(f"Erreur notification webhook: {response.status_code}")
+            for response in responses:
+                if response.status_code < 300:
+                    logger.info("Notification webhook envoyée avec succès")
+                else:
+                    logger.error(f"Erreur notification webhook: {response.status_code}")
                 
         except Exception as e:
             logger.error(f"Erreur notification webhook: {e}")
     
+    def get_twilio_client(self, account_sid: str, auth_token: str):
+        """Retourne le client Twilio associé à ces identifiants, créé au premier usage.
+
+        Le client garde sa propre session HTTP : SMS, WhatsApp et appel partagent
+        ainsi la même connexion TLS vers api.twilio.com.
+        """
+        key = (account_sid, auth_token)
+        with self._twilio_lock:
+            client = self._twilio_clients.get(key)
+            if client is None:
+                client = TwilioClient(account_sid, auth_token)
+                self._twilio_clients[key] = client
+        return client
+    
     def send_twilio_sms(self, email_info: Dict):
         """Envoie un SMS via Twilio"""
+        if TwilioClient is None:
+            logger.error("Bibliothèque Twilio non installée. Installez avec: pip install twilio")
+            return
         try:
-            from twilio.rest import Client
-            
             twilio_config = self.config['notifications']['twilio']
-            client = Client(twilio_config['account_sid'], twilio_config['auth_token'])
+            client = self.get_twilio_client(twilio_config['account_sid'], twilio_config['auth_token'])
             
             message_body = f"📧 Nouveau mail urgent!\n\nDe: {email_info['sender']}\nSujet: {email_info['subject'][:100]}"
             
@@ -479,8 +1097,6 @@ class EmailMonitor:
             
             logger.info(f"SMS Twilio envoyé: {message.sid}")
             
-        except ImportError:
-            logger.error("Bibliothèque Twilio non installée. Installez avec: pip install twilio")
         except Exception as e:
             logger.error(f"Erreur SMS Twilio: {e}")
     
@@ -499,7 +1115,7 @@ class EmailMonitor:
                 'apikey': whatsapp_config['api_key']
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self._http.get(url, params=params, timeout=10)
             
             if "Message queued" in response.text:
                 logger.info("Message WhatsApp CallMeBot envoyé avec succès")
@@ -511,11 +1127,12 @@ class EmailMonitor:
     
     def send_whatsapp_twilio(self, email_info: Dict):
         """Envoie un message WhatsApp via Twilio"""
+        if TwilioClient is None:
+            logger.error("Bibliothèque Twilio non installée. Installez avec: pip install twilio")
+            return
         try:
-            from twilio.rest import Client
-            
             whatsapp_config = self.config['notifications']['whatsapp_twilio']
-            client = Client(whatsapp_config['account_sid'], whatsapp_config['auth_token'])
+            client = self.get_twilio_client(whatsapp_config['account_sid'], whatsapp_config['auth_token'])
             
             message_body = f"📧 *Nouveau mail urgent!*\n\nDe: {email_info['sender']}\nSujet: {email_info['subject'][:100]}\n\n{email_info['content_preview'][:200]}"
             
@@ -527,8 +1144,6 @@ class EmailMonitor:
             
             logger.info(f"WhatsApp Twilio envoyé: {message.sid}")
             
-        except ImportError:
-            logger.error("Bibliothèque Twilio non installée. Installez avec: pip install twilio")
         except Exception as e:
             logger.error(f"Erreur WhatsApp Twilio: {e}")
     
@@ -547,7 +1162,7 @@ class EmailMonitor:
                 'text': message
             }
             
-            response = requests.get(url, params=params, timeout=15)
+            response = self._http.get(url, params=params, timeout=15)
             
             if "Call queued" in response.text or response.status_code == 200:
                 logger.info("Appel CallMeBot lancé avec succès")
@@ -559,11 +1174,12 @@ class EmailMonitor:
     
     def make_call_twilio(self, email_info: Dict):
         """Effectue un appel vocal via Twilio"""
+        if TwilioClient is None:
+            logger.error("Bibliothèque Twilio non installée. Installez avec: pip install twilio")
+            return
         try:
-            from twilio.rest import Client
-            
             call_config = self.config['notifications']['call_twilio']
-            client = Client(call_config['account_sid'], call_config['auth_token'])
+            client = self.get_twilio_client(call_config['account_sid'], call_config['auth_token'])
             
             # Créer le message vocal
             twiml_message = f"<Response><Say voice='alice' language='fr-FR'>{call_config['message']} Email de {email_info['sender']}. Sujet: {email_info['subject'][:50]}.</Say></Response>"
@@ -576,8 +1192,6 @@ class EmailMonitor:
             
             logger.info(f"Appel Twilio initié: {call.sid}")
             
-        except ImportError:
-            logger.error("Bibliothèque Twilio non installée. Installez avec: pip install twilio")
         except Exception as e:
             logger.error(f"Erreur appel Twilio: {e}")
     
@@ -596,7 +1210,7 @@ class EmailMonitor:
                 'msg': message
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self._http.get(url, params=params, timeout=10)
             
             if response.status_code == 200:
                 logger.info("Notification Free Mobile envoyée (déclenchera un appel/SMS)")
@@ -612,123 +1226,191 @@ class EmailMonitor:
             alarm_config = self.config['notifications']['alarm_intensive']
             repeat_count = alarm_config.get('repeat_count', 5)
             interval = alarm_config.get('interval_seconds', 2)
-            sound_file = alarm_config.get('sound_file', '/usr/share/sounds/alsa/Front_Left.wav')
+            sound_file = alarm_config.get('sound_file', DEFAULT_SOUND_FILE)
             
             logger.info(f"Déclenchement alarme intensive ({repeat_count}x) pour email urgent")
             
+            # Avec simpleaudio, le son est rejoué à chaque répétition sans nouveau processus ;
+            # sinon un seul processus aplay enchaîne toutes les répétitions. Les
+            # notifications desktop sont lancées sans attendre dans les deux cas.
+            wave = self.load_wave(sound_file)
+            processes = []
+            playing = []
+            if wave is None:
+                try:
+                    processes.append(subprocess.Popen(
+                        ['aplay', '-q', *([sound_file] * repeat_count)],
+                        stdout=subprocess.DEVNULL,
+                        stderr=subprocess.DEVNULL
+                    ))
+                except Exception as e:
+                    logger.error(f"Erreur son de l'alarme: {e}")
+            
             for i in range(repeat_count):
                 try:
-                    # Son d'alarme
-                    subprocess.run(['aplay', sound_file], check=False, capture_output=True)
-                    
+                    if wave is not None:
+                        playing.append(wave.play())
                     # Notification desktop répétée
-                    subprocess.run([
-                        'notify-send',
-                        '-u', 'critical',
-                        '-t', '5000',
-                        '🚨 ALERTE EMAIL URGENT! 🚨',
-                        f"({i+1}/{repeat_count}) {email_info['subject'][:30]}... DE: {email_info['sender']}"
-                    ], check=False)
-                    
-                    if i < repeat_count - 1:  # Pas de pause après le dernier
-                        time.sleep(interval)
-                        
+                    title = '🚨 ALERTE EMAIL URGENT! 🚨'
+                    message = f"({i+1}/{repeat_count}) {email_info['subject'][:30]}... DE: {email_info['sender']}"
+                    if not self.notify_dbus(title, message, 5000):
+                        processes.append(subprocess.Popen([
+                            'notify-send',
+                            '-u', 'critical',
+                            '-t', '5000',
+                            title,
+                            message
+                        ]))
                 except Exception as e:
                     logger.error(f"Erreur lors de l'alarme {i+1}: {e}")
+                
+                if i < repeat_count - 1:  # Pas de pause après le dernier
+                    time.sleep(interval)
+            
+            for process in processes:
+                process.wait()
+            for play in playing:
+                play.wait_done()
                     
         except Exception as e:
             logger.error(f"Erreur alarme intensive: {e}")
     
-    def send_notifications(self, email_info: Dict):
-        """Envoie toutes les notifications configurées"""
+    def _send_each(self, send, email_infos: List[Dict]):
+        """Envoie les notifications d'un canal pour chaque email, à la suite : la
+        connexion HTTP/le client Twilio du canal sert à tout le lot"""
+        for email_info in email_infos:
+            send(email_info)
+
+    def send_notifications(self, email_infos: List[Dict]):
+        """Envoie toutes les notifications configurées pour un lot de nouveaux emails"""
         notifications_config = self.config['notifications']
         
         # Notification desktop
         if notifications_config['desktop']['enabled']:
-            threading.Thread(target=self.send_desktop_notification, args=(email_info,)).start()
+            self._pool.submit(self._send_each, self.send_desktop_notification, email_infos)
         
-        # Son d'alerte
+        # Son d'alerte (un seul par lot)
         if notifications_config['sound']['enabled']:
-            threading.Thread(target=self.play_sound_notification).start()
+            self._pool.submit(self.play_sound_notification)
         
         # Notification ntfy
         if notifications_config['ntfy']['enabled']:
-            threading.Thread(target=self.send_ntfy_notification, args=(email_info,)).start()
+            self._pool.submit(self.send_ntfy_notification, email_infos)
         
         # Webhook
         if notifications_config['webhook']['enabled']:
-            threading.Thread(target=self.send_webhook_notification, args=(email_info,)).start()
+            self._pool.submit(self.send_webhook_notification, email_infos)
         
         # SMS Twilio
         if notifications_config['twilio']['enabled']:
-            threading.Thread(target=self.send_twilio_sms, args=(email_info,)).start()
+            self._pool.submit(self._send_each, self.send_twilio_sms, email_infos)
         
         # WhatsApp CallMeBot
         if notifications_config['whatsapp_callmebot']['enabled']:
-            threading.Thread(target=self.send_whatsapp_callmebot, args=(email_info,)).start()
+            self._pool.submit(self._send_each, self.send_whatsapp_callmebot, email_infos)
         
         # WhatsApp Twilio
         if notifications_config['whatsapp_twilio']['enabled']:
-            threading.Thread(target=self.send_whatsapp_twilio, args=(email_info,)).start()
+            self._pool.submit(self._send_each, self.send_whatsapp_twilio, email_infos)
         
         # Appels téléphoniques
         if notifications_config['call_callmebot']['enabled']:
-            threading.Thread(target=self.make_call_callmebot, args=(email_info,)).start()
+            self._pool.submit(self._send_each, self.make_call_callmebot, email_infos)
         
         if notifications_config['call_twilio']['enabled']:
-            threading.Thread(target=self.make_call_twilio, args=(email_info,)).start()
+            self._pool.submit(self._send_each, self.make_call_twilio, email_infos)
         
         if notifications_config['call_freemobile']['enabled']:
-            threading.Thread(target=self.make_call_freemobile, args=(email_info,)).start()
+            self._pool.submit(self._send_each, self.make_call_freemobile, email_infos)
         
         # Alarme intensive (comme un appel mais local)
         if notifications_config['alarm_intensive']['enabled']:
-            threading.Thread(target=self.play_intensive_alarm, args=(email_info,)).start()
+            self._pool.submit(self._send_each, self.play_intensive_alarm, email_infos)
     
     def start_monitoring(self):
         """Démarre la surveillance des emails"""
-        if not self.connect_to_imap():
-            return
-        
         self.running = True
         check_interval = self.config['monitoring']['check_interval']
-        
-        logger.info(f"Surveillance démarrée (vérification toutes les {check_interval}s)")
-        
+
+        # Méthodes appelées à chaque tour de boucle, résolues une seule fois
+        check_new_emails = self.check_new_emails
+        send_notifications = self.send_notifications
+        supports_idle = self.supports_idle
+        wait_for_new_emails = self.wait_for_new_emails
+        wait = self._wake.wait
+
         try:
+            # Un échec passager au démarrage est retenté par la boucle avec le même backoff ;
+            # des identifiants refusés arrêtent la surveillance (voir reconnect)
+            if self.reconnect():
+                if supports_idle():
+                    logger.info("Surveillance démarrée (mode IDLE, notifications poussées par le serveur)")
+                else:
+                    logger.info("Surveillance démarrée (vérification toutes les %ss)", check_interval)
+
+            check_needed = True
+            empty_polls = 0
             while self.running:
                 if not self.imap or self.imap.state == 'LOGOUT':
                     logger.info("Connexion IMAP perdue ou inexistante, tentative de reconnexion...")
-                    if not self.connect_to_imap():
-                        logger.warning("Reconnexion échouée, nouvel essai dans 60 secondes.")
-                        time.sleep(60) # Attendre avant de retenter pour ne pas spammer
+                    if not self.reconnect():
                         continue
+                    check_needed = True
 
-                new_emails = self.check_new_emails()
-                
-                for email_info in new_emails:
-                    logger.info(f"Email correspondant détecté: {email_info['subject']}")
-                    self.send_notifications(email_info)
-                
-                time.sleep(check_interval)
+                if check_needed:
+                    previous_uid = self.last_email_uid
+                    new_emails = check_new_emails()
+
+                    for email_info in new_emails:
+                        logger.info("Email correspondant détecté: %s", email_info['subject'])
+                    if new_emails:
+                        send_notifications(new_emails)
+                    # Tout nouvel email, même non retenu par les filtres, signale une boîte active
+                    if self.last_email_uid != previous_uid:
+                        empty_polls = 0
+                        # Le dernier UID n'est sauvegardé qu'une fois les notifications du lot soumises
+                        self.save_state()
+                    else:
+                        empty_polls += 1
+
+                if supports_idle():
+                    check_needed = wait_for_new_emails()
+                    if not check_needed and self.imap:
+                        # Délai IDLE écoulé sans nouveau mail : simple keepalive
+                        try:
+                            self._imap_call('noop')
+                        except (imaplib.IMAP4.error, OSError) as e:
+                            logger.error("Keepalive IMAP échoué: %s", e)
+                            self._drop_connection()
+                else:
+                    # Sans IDLE, l'intervalle double à chaque vérification sans nouvel email
+                    # (jusqu'à 16x, plafonné à 10 min) et revient au réglage dès qu'un email arrive
+                    wait(min(check_interval * 2 ** min(empty_polls, 4), max(check_interval, MAX_POLL_INTERVAL)))
+                    check_needed = True
                 
         except KeyboardInterrupt:
             logger.info("Arrêt demandé par l'utilisateur")
         except Exception as e:
-            logger.error(f"Erreur dans la boucle de surveillance: {e}")
+            logger.error("Erreur dans la boucle de surveillance: %s", e)
         finally:
             self.stop_monitoring()
     
     def stop_monitoring(self):
-        """Arrête la surveillance"""
+        """Arrête la surveillance (sans effet si elle est déjà arrêtée)"""
+        if not self.running:
+            return
         self.running = False
+        self._wake.set()
+        # Les notifications déjà soumises se terminent sans bloquer l'arrêt : leurs UID
+        # sont sauvegardés comme traités, elles ne seraient pas renvoyées au redémarrage
+        self._pool.shutdown(wait=False)
         if self.imap:
             try:
-                self.imap.close()
                 self.imap.logout()
                 logger.info("Connexion IMAP fermée")
-            except:
-                pass
+            except Exception as e:
+                logger.debug("Échec du LOGOUT IMAP: %s", e)
+            self.imap = None
 
     def send_ntfy_error_notification(self, title: str, message: str):
         """Envoie une notification d'erreur générique via ntfy.sh avec un cooldown."""
@@ -754,7 +1436,7 @@ class EmailMonitor:
                 'tags': ['rotating_light', 'error']
             }
             
-            response = requests.post(ntfy_config['url'], json=data, timeout=10)
+            response = self._http.post(ntfy_config['url'], data=json_dumps(data), headers=JSON_HEADERS, timeout=10)
             
             if response.status_code == 200:
                 logger.info("Notification d'erreur ntfy envoyée avec succès")
@@ -766,14 +1448,26 @@ class EmailMonitor:
         except Exception as e:
             logger.error(f"Impossible d'envoyer la notification d'erreur ntfy: {e}")
 
+def handle_termination(signum, frame):
+    """Convertit SIGTERM/SIGINT en KeyboardInterrupt : la boucle de surveillance
+    se termine alors par stop_monitoring(), qui ferme proprement la session IMAP"""
+    logger.info("Signal %s reçu, arrêt en cours", signal.Signals(signum).name)
+    raise KeyboardInterrupt
+
 def main():
     """Fonction principale"""
     monitor = EmailMonitor()
+    # systemd et docker arrêtent le service avec SIGTERM
+    signal.signal(signal.SIGTERM, handle_termination)
+    signal.signal(signal.SIGINT, handle_termination)
     
     try:
         monitor.start_monitoring()
     except Exception as e:
         logger.error(f"Erreur fatale: {e}")
 
+    if monitor.login_rejected:
+        sys.exit(EXIT_LOGIN_REJECTED)
+
 if __name__ == "__main__":
     main()